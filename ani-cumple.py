@@ -7,23 +7,45 @@ Compatible con hosting compartido y VPS con Portainer
 """
 
 import os
+import re
+import calendar
 import json
 import time
+import atexit
 import logging
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from dotenv import load_dotenv
+from cachetools import TTLCache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+from urllib.parse import urljoin, urlparse
+import asyncio
+import aiohttp
+import lxml.etree
+import lxml.html
 import threading
-import queue
-import tempfile
-import shutil
+import functools
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor
 
 # Configurar logging
 logging.basicConfig(
@@ -36,12 +58,100 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+load_dotenv('config.env')
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask que serializa las respuestas con orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+if orjson:
+    app.json = ORJSONProvider(app)
 CORS(app)  # Permitir CORS para llamadas desde cualquier origen
+if Compress:
+    Compress(app)  # Comprimir respuestas (gzip/deflate/br) según Accept-Encoding del cliente
 
-# Cola para manejar las tareas de scraping
-scraping_queue = queue.Queue()
-scraping_results = {}
+# Resultados de las tareas de scraping: expiran solos tras 1 hora y se limitan a 1024 tareas.
+# TTLCache no es thread-safe, todo acceso pasa por results_lock
+scraping_results = TTLCache(maxsize=1024, ttl=3600)
+results_lock = threading.RLock()
+
+def set_result(task_id, result):
+    """Guarda el resultado de una tarea bajo results_lock"""
+    with results_lock:
+        scraping_results[task_id] = result
+
+def get_result(task_id):
+    """Obtiene el resultado de una tarea bajo results_lock (None si no existe o expiró)"""
+    with results_lock:
+        return scraping_results.get(task_id)
+
+# Backend de scraping: auto (HTTP con respaldo en Selenium), http o selenium
+SCRAPER_BACKEND = os.getenv('SCRAPER_BACKEND', 'auto').lower()
+HTTP_WORKERS = int(os.getenv('HTTP_WORKERS', 8))
+SELENIUM_WORKERS = int(os.getenv('SELENIUM_WORKERS', 2))
+
+def install_chromedriver():
+    """Resuelve la ruta de ChromeDriver con ChromeDriverManager (None si no está disponible)"""
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+        return ChromeDriverManager().install()
+    except Exception as e:
+        logger.warning(f"No se pudo usar ChromeDriverManager: {e}")
+        return None
+
+# Se resuelve una sola vez al cargar el módulo; los procesos del pool de Selenium la heredan
+_DRIVER_PATH = install_chromedriver() if SCRAPER_BACKEND != 'http' else None
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+HTTP_TIMEOUT = 15
+
+# Recursos que Chrome no descarga al hacer scraping
+BLOCKED_RESOURCES = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+                     "*.css", "*.woff", "*.woff2", "*.ttf", "*.mp4"]
+
+# Selectores XPath compilados una sola vez y reutilizados en cada fila
+ROW_XP = lxml.etree.XPath(".//tr|.//*[@role='row']|.//div[contains(@class, 'row')]")
+ITEM_XP = lxml.etree.XPath(".//div[contains(@class, 'item') or contains(@class, 'entry') or contains(@class, 'data')]")
+CELL_XP = lxml.etree.XPath(".//td|.//*[@role='cell']|.//div[contains(@class, 'cell')]")
+# Filtro de palabras clave evaluado dentro de libxml2 (sin mayúsculas) para ubicar la tabla
+_LOWER_TEXT = "translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZÑ', 'abcdefghijklmnopqrstuvwxyzñ')"
+_HAS_BIRTHDAY_KEYWORD = "[.//text()[" + " or ".join(
+    f"contains({_LOWER_TEXT}, '{keyword}')" for keyword in ('cumplea', 'fecha', 'edad', 'nombre')
+) + "]]"
+TABLE_XPS = [lxml.etree.XPath(f"({selector}){_HAS_BIRTHDAY_KEYWORD}[1]") for selector in (
+    "//table",
+    "//*[contains(concat(' ', normalize-space(@class), ' '), ' table ')]",
+    "//*[contains(@class, 'table')]",
+    "//div[@role='table']",
+    "//*[contains(@class, 'list')]",
+    "//div[contains(@class, 'overflow')]",
+    "//div[contains(@class, 'container')]"
+)]
+# Cantidad de apellidos según el número de palabras del nombre; el resto usa la mitad.
+# Los apellidos compuestos (DE LA, VAN DER...) terminan con el mismo orden, no requieren casos aparte
+_SURNAME_COUNT = {3: 2, 5: 3}
+
+# Nombres de los meses para el archivo de descarga, indexados por mes - 1
+_MESES = ("enero", "febrero", "marzo", "abril", "mayo", "junio", "julio",
+          "agosto", "septiembre", "octubre", "noviembre", "diciembre")
+
+# Días por mes en año no bisiesto; febrero se ajusta según el año de ejecución
+_DIAS_MES = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# Patrones precompilados para clasificar las celdas de cada fila
+_HAS_DIGIT = re.compile(r'\d').search
+_DATE_RE = re.compile(r'\d{1,2}/\d{1,2}').fullmatch
+_PHONE_RE = re.compile(r'\d{10}').fullmatch
+_AGE_RE = re.compile(r'\d{1,3}').fullmatch
+
+BIRTHDAY_TEXT_XP = lxml.etree.XPath("//*[contains(text(), 'cumpleaños') or contains(text(), 'cumpleañeros')]")
+BIRTHDAY_CONTAINER_XP = lxml.etree.XPath("./ancestor::div[contains(@class, 'container') or contains(@class, 'table') or contains(@class, 'list')]")
 
 class HermessAPIScraper:
     def __init__(self):
@@ -58,6 +168,8 @@ class HermessAPIScraper:
         
         self.driver = None
         self.wait = None
+        self.logged_in = False
+        self.year = datetime.now().year
         
     def setup_driver(self, headless=True):
         """Configura el driver de Chrome con opciones optimizadas para diferentes entornos"""
@@ -68,11 +180,17 @@ class HermessAPIScraper:
         chrome_options.add_argument("--disable-dev-shm-usage")
         chrome_options.add_argument("--disable-gpu")
         chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
+        chrome_options.add_argument(f"--user-agent={USER_AGENT}")
         chrome_options.add_argument("--disable-blink-features=AutomationControlled")
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
         chrome_options.add_experimental_option('useAutomationExtension', False)
         
+        # driver.get() vuelve cuando el DOM está listo; las esperas explícitas cubren el resto
+        chrome_options.page_load_strategy = 'eager'
+        
+        # Solo se extrae texto: no descargar imágenes en ningún entorno
+        chrome_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        
         # Configuración específica para hosting compartido
         if os.getenv('ENVIRONMENT') == 'shared_hosting':
             chrome_options.add_argument("--disable-extensions")
@@ -94,17 +212,22 @@ class HermessAPIScraper:
         if headless:
             chrome_options.add_argument("--headless")
         
-        # Intentar usar ChromeDriverManager si está disponible
-        try:
-            from webdriver_manager.chrome import ChromeDriverManager
-            from selenium.webdriver.chrome.service import Service
-            service = Service(ChromeDriverManager().install())
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        except Exception as e:
-            logger.warning(f"No se pudo usar ChromeDriverManager: {e}")
+        # Usar el ChromeDriver que ChromeDriverManager resolvió al iniciar, si está disponible
+        self.driver = None
+        if _DRIVER_PATH:
+            try:
+                self.driver = webdriver.Chrome(service=Service(_DRIVER_PATH), options=chrome_options)
+            except Exception as e:
+                logger.warning(f"No se pudo usar ChromeDriverManager: {e}")
+        
+        if self.driver is None:
             # Fallback a ChromeDriver local
             self.driver = webdriver.Chrome(options=chrome_options)
         
+        # Bloquear imágenes, hojas de estilo, fuentes y video: basta con el HTML
+        self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_RESOURCES})
+        self.driver.execute_cdp_cmd("Network.enable", {})
+        
         self.wait = WebDriverWait(self.driver, 15)
         
     def login(self):
@@ -130,33 +253,59 @@ class HermessAPIScraper:
             password_field.send_keys(self.password)
             
             # Buscar y hacer clic en el botón de login
+            login_page_url = self.driver.current_url
             login_button = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
             login_button.click()
             
-            # Esperar a que se complete el login
-            time.sleep(3)
+            # Esperar a que se complete el login: redirección fuera del formulario o menú de usuario
+            self.wait.until(EC.any_of(
+                EC.url_contains(urlparse(self.birthdays_url).path),
+                EC.presence_of_element_located((By.CSS_SELECTOR, "nav.user-menu")),
+                EC.url_changes(login_page_url)
+            ))
             
             logger.info("✅ Sesión iniciada exitosamente")
+            self.logged_in = True
             return True
             
         except Exception as e:
             logger.error(f"❌ Error durante el login: {str(e)}")
+            self.logged_in = False
             return False
     
+    def session_expired(self):
+        """Detecta si HermessApp redirigió al login porque la sesión expiró"""
+        try:
+            return '/login' in self.driver.current_url
+        except WebDriverException:
+            return True
+    
+    def close(self):
+        """Cierra el navegador y descarta la sesión actual"""
+        if self.driver:
+            try:
+                self.driver.quit()
+                logger.info("🔒 Navegador cerrado")
+            except Exception as e:
+                logger.warning(f"⚠️ Error cerrando el navegador: {str(e)}")
+        self.driver = None
+        self.wait = None
+        self.logged_in = False
+    
     def navigate_to_birthdays(self):
         """Navega a la página de cumpleaños"""
         try:
             logger.info("🔄 Navegando a la página de cumpleaños...")
             self.driver.get(self.birthdays_url)
-            time.sleep(3)
             
-            # Esperar a que cargue algún contenido
+            # Esperar a que aparezcan las filas de la tabla (o la redirección al login si la sesión expiró)
             try:
-                self.wait.until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "body"))
-                )
-            except:
-                pass
+                self.wait.until(EC.any_of(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "table tr")),
+                    EC.url_contains('/login')
+                ))
+            except TimeoutException:
+                logger.warning("⚠️ No apareció ninguna tabla, se analizará el contenido disponible")
             
             logger.info("✅ Página de cumpleaños cargada")
             return True
@@ -170,72 +319,36 @@ class HermessAPIScraper:
         try:
             logger.info("🔄 Extrayendo datos de cumpleaños...")
             
-            # Esperar un poco más para que la página cargue completamente
-            time.sleep(2)
+            # Año de ejecución calculado una vez por extracción (el scraper vive entre tareas)
+            self.year = datetime.now().year
             
-            # Buscar la tabla con selectores más específicos
-            table_selectors = [
-                "table",
-                ".table",
-                "[class*='table']",
-                "div[role='table']",
-                "[class*='list']",
-                "div[class*='overflow']",
-                "div[class*='container']"
-            ]
+            # Una sola lectura del HTML de la página; la búsqueda se hace en memoria
+            tree = lxml.html.fromstring(self.get_page_source())
             
+            # Buscar la tabla con selectores más específicos
             table = None
-            for selector in table_selectors:
-                try:
-                    elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    for element in elements:
-                        if self._contains_birthday_data(element):
-                            table = element
-                            break
-                    if table:
-                        break
-                except NoSuchElementException:
-                    continue
-            
-            if not table:
-                try:
-                    birthday_text = self.driver.find_element(By.XPATH, "//*[contains(text(), 'cumpleaños') or contains(text(), 'cumpleañeros')]")
-                    logger.info(f"📍 Encontrado texto relacionado: {birthday_text.text}")
-                    table = birthday_text.find_element(By.XPATH, "./ancestor::div[contains(@class, 'container') or contains(@class, 'table') or contains(@class, 'list')]")
-                except:
-                    pass
-            
-            if not table:
+            for selector in TABLE_XPS:
+                matches = selector(tree)
+                if matches:
+                    table = matches[0]
+                    break
+            
+            if table is None:
+                birthday_texts = BIRTHDAY_TEXT_XP(tree)
+                if birthday_texts:
+                    logger.info(f"📍 Encontrado texto relacionado: {birthday_texts[0].text_content().strip()}")
+                    ancestors = BIRTHDAY_CONTAINER_XP(birthday_texts[0])
+                    if ancestors:
+                        table = ancestors[0]
+            
+            if table is None:
                 raise Exception("No se pudo encontrar la tabla de cumpleaños")
             
-            logger.info(f"📍 Tabla encontrada con selector: {table.tag_name}")
-            
-            # Extraer filas de la tabla
-            rows = table.find_elements(By.CSS_SELECTOR, "tr, [role='row'], div[class*='row']")
-            
-            if not rows:
-                rows = table.find_elements(By.CSS_SELECTOR, "div[class*='item'], div[class*='entry'], div[class*='data']")
+            logger.info(f"📍 Tabla encontrada con selector: {table.tag}")
             
-            logger.info(f"📍 Encontradas {len(rows)} filas potenciales")
+            rows = ROW_XP(table) or ITEM_XP(table)
             
-            birthdays_data = []
-            
-            for i, row in enumerate(rows):
-                try:
-                    cells = row.find_elements(By.CSS_SELECTOR, "td, [role='cell'], div[class*='cell'], span, div")
-                    
-                    if len(cells) >= 3:
-                        cell_texts = [cell.text.strip() for cell in cells if cell.text.strip()]
-                        
-                        if len(cell_texts) >= 3:
-                            birthday_entry = self._parse_birthday_row(cell_texts)
-                            if birthday_entry:
-                                birthdays_data.append(birthday_entry)
-                                logger.info(f"  ✅ Fila {i+1}: {birthday_entry['nombre']} - {birthday_entry['cumpleanos']}")
-                        
-                except Exception as e:
-                    logger.warning(f"⚠️ Error procesando fila {i+1}: {str(e)}")
-                    continue
+            birthdays_data = self._parse_rows(rows)
             
             logger.info(f"✅ Se extrajeron {len(birthdays_data)} registros de cumpleaños")
             return birthdays_data
@@ -244,14 +357,32 @@ class HermessAPIScraper:
             logger.error(f"❌ Error extrayendo datos: {str(e)}")
             return []
     
-    def _contains_birthday_data(self, element):
-        """Verifica si un elemento contiene datos de cumpleaños"""
-        try:
-            text = element.text.lower()
-            birthday_keywords = ['cumpleaños', 'cumpleañeros', 'fecha', 'edad', 'nombre']
-            return any(keyword in text for keyword in birthday_keywords)
-        except:
-            return False
+    def get_page_source(self):
+        """Obtiene el HTML de la página actual en una sola llamada al navegador"""
+        return self.driver.page_source
+    
+    def _parse_rows(self, rows):
+        """Convierte filas lxml en registros de cumpleaños"""
+        logger.info(f"📍 Encontradas {len(rows)} filas potenciales")
+        
+        birthdays_data = []
+        
+        for i, row in enumerate(rows):
+            try:
+                cell_texts = [" ".join(cell.text_content().split()) for cell in CELL_XP(row)]
+                cell_texts = [text for text in cell_texts if text]
+                
+                if len(cell_texts) >= 3:
+                    birthday_entry = self._parse_birthday_row(cell_texts)
+                    if birthday_entry:
+                        birthdays_data.append(birthday_entry)
+                        logger.info(f"  ✅ Fila {i+1}: {birthday_entry['nombre']} - {birthday_entry['cumpleanos']}")
+                    
+            except Exception as e:
+                logger.warning(f"⚠️ Error procesando fila {i+1}: {str(e)}")
+                continue
+        
+        return birthdays_data
     
     def _parse_birthday_row(self, cell_texts):
         """Parsea una fila de datos de cumpleaños"""
@@ -266,13 +397,13 @@ class HermessAPIScraper:
                 if not text:
                     continue
                 
-                if len(text) > 5 and not any(char.isdigit() for char in text) and not nombre:
+                if not nombre and len(text) > 5 and not _HAS_DIGIT(text):
                     nombre = text
-                elif '/' in text and len(text) <= 5 and not fecha:
+                elif not fecha and _DATE_RE(text):
                     fecha = text
-                elif text.isdigit() and len(text) == 10 and not celular:
+                elif not celular and _PHONE_RE(text):
                     celular = text
-                elif text.isdigit() and 1 <= len(text) <= 3 and not edad:
+                elif not edad and _AGE_RE(text):
                     edad = text
             
             if nombre and fecha:
@@ -303,50 +434,9 @@ class HermessAPIScraper:
             if len(palabras) < 2:
                 return nombre
             
-            if len(palabras) == 5:
-                apellidos_compuestos_inicio = ['DE', 'DEL', 'VAN', 'VON', 'MAC', 'MC']
-                
-                if palabras[0].upper() in apellidos_compuestos_inicio:
-                    if palabras[0].upper() in ['DE', 'DEL'] and palabras[1].upper() in ['LA', 'LOS', 'LAS']:
-                        return f"{palabras[3]} {palabras[4]} {palabras[0]} {palabras[1]} {palabras[2]}"
-                    elif palabras[0].upper() in ['VAN', 'VON'] and palabras[1].upper() == 'DER':
-                        return f"{palabras[3]} {palabras[4]} {palabras[0]} {palabras[1]} {palabras[2]}"
-                    else:
-                        return f"{palabras[3]} {palabras[4]} {palabras[0]} {palabras[1]} {palabras[2]}"
-                else:
-                    return f"{palabras[3]} {palabras[4]} {palabras[0]} {palabras[1]} {palabras[2]}"
-            
-            elif len(palabras) == 6:
-                apellidos_compuestos_inicio = ['DE', 'DEL', 'VAN', 'VON']
-                
-                if palabras[0].upper() in apellidos_compuestos_inicio:
-                    if palabras[0].upper() in ['DE', 'DEL'] and palabras[1].upper() in ['LA', 'LOS', 'LAS']:
-                        return f"{palabras[3]} {palabras[4]} {palabras[5]} {palabras[0]} {palabras[1]} {palabras[2]}"
-                    else:
-                        mitad = len(palabras) // 2
-                        apellidos = palabras[:mitad]
-                        nombres = palabras[mitad:]
-                        return f"{' '.join(nombres)} {' '.join(apellidos)}"
-                else:
-                    mitad = len(palabras) // 2
-                    apellidos = palabras[:mitad]
-                    nombres = palabras[mitad:]
-                    return f"{' '.join(nombres)} {' '.join(apellidos)}"
-            
-            elif len(palabras) == 4:
-                return f"{palabras[2]} {palabras[3]} {palabras[0]} {palabras[1]}"
-            
-            elif len(palabras) == 3:
-                return f"{palabras[2]} {palabras[0]} {palabras[1]}"
-            
-            elif len(palabras) == 2:
-                return f"{palabras[1]} {palabras[0]}"
-            
-            else:
-                mitad = len(palabras) // 2
-                apellidos = palabras[:mitad]
-                nombres = palabras[mitad:]
-                return f"{' '.join(nombres)} {' '.join(apellidos)}"
+            # Los primeros `apellidos` términos son los apellidos y el resto los nombres
+            apellidos = _SURNAME_COUNT.get(len(palabras), len(palabras) // 2)
+            return " ".join(palabras[apellidos:] + palabras[:apellidos])
             
         except Exception as e:
             logger.warning(f"⚠️ Error reordenando nombre '{nombre}': {str(e)}")
@@ -376,20 +466,21 @@ class HermessAPIScraper:
     def _convert_date_to_n8n_format(self, fecha_dd_mm):
         """Convierte fecha DD/MM a formato YYYY-MM-DD usando siempre el año de ejecución"""
         try:
-            if '/' not in fecha_dd_mm:
+            dia, _, mes = fecha_dd_mm.partition('/')
+            if not mes:
                 return fecha_dd_mm
             
-            partes = fecha_dd_mm.split('/')
-            if len(partes) != 2:
-                return fecha_dd_mm
+            dia = int(dia)
+            mes = int(mes)
             
-            dia = int(partes[0])
-            mes = int(partes[1])
+            if not 1 <= mes <= 12:
+                raise ValueError("mes fuera de rango")
             
-            año_ejecucion = datetime.now().year
-            fecha_completa = datetime(año_ejecucion, mes, dia)
+            dias_del_mes = 29 if mes == 2 and calendar.isleap(self.year) else _DIAS_MES[mes - 1]
+            if not 1 <= dia <= dias_del_mes:
+                raise ValueError("día fuera de rango para el mes")
             
-            return fecha_completa.strftime("%Y-%m-%d")
+            return f"{self.year:04d}-{mes:02d}-{dia:02d}"
             
         except Exception as e:
             logger.warning(f"⚠️ Error convirtiendo fecha {fecha_dd_mm}: {str(e)}")
@@ -398,19 +489,13 @@ class HermessAPIScraper:
     def _remove_duplicates(self, data):
         """Elimina registros duplicados basados en nombre y celular"""
         try:
-            seen = set()
-            unique_data = []
-            duplicates_removed = 0
-            
+            # Una sola pasada; setdefault conserva el primer registro de cada clave
+            unique = {}
             for entry in data:
-                key = (entry.get('nombre', ''), entry.get('celular', ''))
-                
-                if key not in seen:
-                    seen.add(key)
-                    unique_data.append(entry)
-                else:
-                    duplicates_removed += 1
-                    logger.info(f"🔄 Duplicado eliminado: {entry.get('nombre', 'Sin nombre')}")
+                unique.setdefault((entry.get('nombre', ''), entry.get('celular', '')), entry)
+            
+            unique_data = list(unique.values())
+            duplicates_removed = len(data) - len(unique_data)
             
             if duplicates_removed > 0:
                 logger.info(f"✅ Se eliminaron {duplicates_removed} registros duplicados")
@@ -421,85 +506,297 @@ class HermessAPIScraper:
             logger.warning(f"⚠️ Error eliminando duplicados: {str(e)}")
             return data
     
+    def _error_result(self, message):
+        """Construye el resultado de una tarea fallida"""
+        return {
+            'status': 'error',
+            'message': message,
+            'data': None
+        }
+    
+    def _data_result(self, task_id, birthdays_data):
+        """Construye el resultado de una tarea a partir de los datos extraídos"""
+        if birthdays_data:
+            data_unique = self._remove_duplicates(birthdays_data)
+            
+            logger.info(f"✅ Scraping completado para tarea {task_id}: {len(data_unique)} registros")
+            return {
+                'status': 'success',
+                'message': f'Scraping completado exitosamente',
+                'data': data_unique,
+                'total_records': len(data_unique),
+                'timestamp': datetime.now().isoformat()
+            }
+        
+        logger.error(f"❌ No se pudieron extraer datos para tarea {task_id}")
+        return self._error_result('No se pudieron extraer datos')
+    
     def run_scraping(self, task_id):
-        """Ejecuta el scraping completo"""
+        """Ejecuta el scraping completo reutilizando el navegador y la sesión si ya existen"""
         try:
             logger.info(f"🚀 Iniciando scraping para tarea {task_id}...")
             
-            # Configurar driver según el entorno
-            headless = os.getenv('HEADLESS', 'true').lower() == 'true'
-            self.setup_driver(headless=headless)
+            # Configurar driver según el entorno solo la primera vez
+            if not self.driver:
+                headless = os.getenv('HEADLESS', 'true').lower() == 'true'
+                self.setup_driver(headless=headless)
             
-            if not self.login():
-                scraping_results[task_id] = {
-                    'status': 'error',
-                    'message': 'Error durante el login',
-                    'data': None
-                }
-                return
+            if not self.logged_in and not self.login():
+                return self._error_result('Error durante el login')
             
-            if not self.navigate_to_birthdays():
-                scraping_results[task_id] = {
-                    'status': 'error',
-                    'message': 'Error navegando a la página de cumpleaños',
-                    'data': None
-                }
-                return
+            navigated = self.navigate_to_birthdays()
             
-            birthdays_data = self.extract_birthday_data()
+            # Si la sesión expiró HermessApp redirige al login: iniciar sesión de nuevo
+            if navigated and self.session_expired():
+                logger.info("🔄 La sesión expiró, iniciando sesión de nuevo...")
+                if not self.login():
+                    return self._error_result('Error durante el login')
+                navigated = self.navigate_to_birthdays()
             
-            if birthdays_data:
-                data_unique = self._remove_duplicates(birthdays_data)
-                
-                scraping_results[task_id] = {
-                    'status': 'success',
-                    'message': f'Scraping completado exitosamente',
-                    'data': data_unique,
-                    'total_records': len(data_unique),
-                    'timestamp': datetime.now().isoformat()
-                }
-                logger.info(f"✅ Scraping completado para tarea {task_id}: {len(data_unique)} registros")
-            else:
-                scraping_results[task_id] = {
-                    'status': 'error',
-                    'message': 'No se pudieron extraer datos',
-                    'data': None
-                }
-                logger.error(f"❌ No se pudieron extraer datos para tarea {task_id}")
+            if not navigated:
+                return self._error_result('Error navegando a la página de cumpleaños')
+            
+            return self._data_result(task_id, self.extract_birthday_data())
                 
         except Exception as e:
             logger.error(f"❌ Error general en scraping para tarea {task_id}: {str(e)}")
-            scraping_results[task_id] = {
-                'status': 'error',
-                'message': f'Error general: {str(e)}',
-                'data': None
-            }
             
-        finally:
-            if self.driver:
-                self.driver.quit()
-                logger.info("🔒 Navegador cerrado")
+            # El navegador pudo quedar en mal estado: se recrea en la siguiente tarea
+            self.close()
+            return self._error_result(f'Error general: {str(e)}')
+
+class HermessHTTPScraper(HermessAPIScraper):
+    """Scraper sin navegador: inicia sesión y descarga la tabla con aiohttp + lxml"""
+    
+    def __init__(self):
+        super().__init__()
+        self.session = None
+        self.current_url = None
+        self.page_source = None
+        self.requires_browser = False
+    
+    async def setup_driver(self):
+        """Crea la sesión HTTP (se reutiliza entre tareas, igual que el navegador)"""
+        if self.session is None:
+            # unsafe=True conserva las cookies también cuando la URL usa una IP
+            self.session = aiohttp.ClientSession(
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+                headers={'User-Agent': USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+            )
+    
+    async def login(self):
+        """Inicia sesión enviando el formulario de login con su token CSRF"""
+        try:
+            logger.info("🔄 Iniciando sesión en HermessApp (HTTP)...")
+            async with self.session.get(self.login_url) as response:
+                response.raise_for_status()
+                login_page_url = str(response.url)
+                tree = lxml.html.fromstring(await response.read())
+            
+            tokens = tree.xpath("//input[@name='_token']/@value")
+            actions = tree.xpath("//form[contains(@action, 'login')]/@action")
+            
+            # Sin formulario ni token el login depende de JavaScript: se necesita Selenium
+            if not tokens:
+                self.requires_browser = True
+                raise Exception("No se encontró el token CSRF del formulario de login")
+            
+            action = urljoin(login_page_url, actions[0]) if actions else self.login_url
+            async with self.session.post(action, data={
+                'email': self.email,
+                'password': self.password,
+                '_token': tokens[0]
+            }) as response:
+                response.raise_for_status()
+                self.current_url = str(response.url)
+            
+            if self.session_expired():
+                raise Exception("HermessApp rechazó las credenciales")
+            
+            logger.info("✅ Sesión iniciada exitosamente")
+            self.logged_in = True
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Error durante el login: {str(e)}")
+            self.logged_in = False
+            return False
+    
+    def session_expired(self):
+        """Detecta si la última respuesta terminó redirigida al login"""
+        return not self.current_url or '/login' in self.current_url
+    
+    async def navigate_to_birthdays(self):
+        """Descarga el HTML de la página de cumpleaños"""
+        try:
+            logger.info("🔄 Descargando la página de cumpleaños...")
+            async with self.session.get(self.birthdays_url) as response:
+                response.raise_for_status()
+                self.current_url = str(response.url)
+                self.page_source = await response.read()
+            
+            logger.info("✅ Página de cumpleaños cargada")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Error navegando a la página de cumpleaños: {str(e)}")
+            return False
+    
+    def get_page_source(self):
+        """Devuelve el HTML descargado de la página de cumpleaños"""
+        return self.page_source
+    
+    async def run_scraping(self, task_id):
+        """Ejecuta el scraping completo por HTTP reutilizando la sesión si ya existe"""
+        try:
+            logger.info(f"🚀 Iniciando scraping HTTP para tarea {task_id}...")
+            
+            await self.setup_driver()
+            
+            if not self.logged_in and not await self.login():
+                return self._error_result('Error durante el login')
+            
+            navigated = await self.navigate_to_birthdays()
+            
+            # Si la sesión expiró HermessApp redirige al login: iniciar sesión de nuevo
+            if navigated and self.session_expired():
+                logger.info("🔄 La sesión expiró, iniciando sesión de nuevo...")
+                if not await self.login():
+                    return self._error_result('Error durante el login')
+                navigated = await self.navigate_to_birthdays()
+            
+            if not navigated:
+                return self._error_result('Error navegando a la página de cumpleaños')
+            
+            return self._data_result(task_id, self.extract_birthday_data())
+            
+        except Exception as e:
+            logger.error(f"❌ Error general en scraping para tarea {task_id}: {str(e)}")
+            
+            # La sesión pudo quedar en mal estado: se recrea en la siguiente tarea
+            await self.close()
+            return self._error_result(f'Error general: {str(e)}')
+    
+    async def close(self):
+        """Cierra la sesión HTTP"""
+        if self.session:
+            await self.session.close()
+        self.session = None
+        self.current_url = None
+        self.page_source = None
+        self.logged_in = False
 
-def worker():
-    """Worker que procesa las tareas de scraping en segundo plano"""
+# Scraper del proceso actual: cada proceso del pool conserva su navegador entre tareas
+_process_scraper = None
+
+def run_scraping_entrypoint(task_id):
+    """Ejecuta una tarea con Selenium dentro de un proceso del pool y devuelve su resultado"""
+    global _process_scraper
+    if _process_scraper is None:
+        _process_scraper = HermessAPIScraper()
+        # Los procesos del pool no ejecutan atexit: cerrar Chrome al finalizar el proceso
+        multiprocessing.util.Finalize(_process_scraper, _process_scraper.close, exitpriority=10)
+    
+    return _process_scraper.run_scraping(task_id)
+
+def store_selenium_result(task_id, future):
+    """Guarda en el proceso principal el resultado de una tarea de Selenium"""
+    selenium_futures.discard(future)
+    try:
+        result = future.result()
+    except Exception as e:
+        logger.error(f"Error en worker Selenium: {str(e)}")
+        result = {
+            'status': 'error',
+            'message': f'Error general: {str(e)}',
+            'data': None
+        }
+    
+    set_result(task_id, result)
+
+def submit_selenium_task(task_id):
+    """Envía una tarea al pool de procesos de Selenium"""
+    future = selenium_executor.submit(run_scraping_entrypoint, task_id)
+    selenium_futures.add(future)
+    future.add_done_callback(functools.partial(store_selenium_result, task_id))
+
+async def http_worker():
+    """Worker asíncrono que procesa tareas por HTTP; varias corren a la vez en el mismo loop"""
+    scraper = None
     while True:
+        task_id = await http_queue.get()
         try:
-            task_id = scraping_queue.get()
             if task_id is None:
                 break
             
-            scraper = HermessAPIScraper()
-            scraper.run_scraping(task_id)
+            if scraper is None:
+                scraper = HermessHTTPScraper()
             
-            scraping_queue.task_done()
+            result = await scraper.run_scraping(task_id)
+            
+            # Si el login necesita JavaScript se pasa a Selenium para esta y las siguientes tareas
+            if SCRAPER_BACKEND == 'auto' and scraper.requires_browser:
+                logger.warning("⚠️ El login requiere JavaScript, usando Selenium")
+                http_backend_disabled.set()
+                submit_selenium_task(task_id)
+            else:
+                set_result(task_id, result)
             
         except Exception as e:
-            logger.error(f"Error en worker: {str(e)}")
-            scraping_queue.task_done()
+            logger.error(f"Error en worker HTTP: {str(e)}")
+            set_result(task_id, {
+                'status': 'error',
+                'message': f'Error general: {str(e)}',
+                'data': None
+            })
+            
+        finally:
+            http_queue.task_done()
+    
+    if scraper:
+        await scraper.close()
+
+async def create_http_queue():
+    """Crea la cola de tareas HTTP dentro del loop que la va a usar"""
+    return asyncio.Queue()
+
+def run_http_workers():
+    """Ejecuta los workers HTTP en el loop de asyncio del hilo de fondo"""
+    asyncio.set_event_loop(http_loop)
+    http_loop.run_until_complete(asyncio.gather(*(http_worker() for _ in range(HTTP_WORKERS))))
 
-# Iniciar worker en segundo plano
-worker_thread = threading.Thread(target=worker, daemon=True)
-worker_thread.start()
+def dispatch_task(task_id):
+    """Envía la tarea al backend configurado"""
+    if SCRAPER_BACKEND == 'selenium' or http_backend_disabled.is_set():
+        submit_selenium_task(task_id)
+    else:
+        http_loop.call_soon_threadsafe(http_queue.put_nowait, task_id)
+
+def pending_tasks():
+    """Cantidad de tareas pendientes en el pool de Selenium y en la cola HTTP"""
+    return len(selenium_futures) + http_queue.qsize()
+
+def stop_worker():
+    """Detiene los workers y cierra los navegadores y las sesiones HTTP al apagar la API"""
+    for _ in range(HTTP_WORKERS):
+        http_loop.call_soon_threadsafe(http_queue.put_nowait, None)
+    http_thread.join(timeout=10)
+    selenium_executor.shutdown(wait=True, cancel_futures=True)
+
+# Iniciar workers solo en el proceso principal (no en los procesos del pool de Selenium):
+# Selenium en un pool de procesos, cada uno con su Chrome, y HTTP en un loop de asyncio
+if multiprocessing.parent_process() is None:
+    selenium_executor = ProcessPoolExecutor(max_workers=SELENIUM_WORKERS)
+    selenium_futures = set()
+    
+    http_loop = asyncio.new_event_loop()
+    http_queue = http_loop.run_until_complete(create_http_queue())
+    http_backend_disabled = threading.Event()
+    
+    http_thread = threading.Thread(target=run_http_workers, daemon=True)
+    http_thread.start()
+    atexit.register(stop_worker)
 
 @app.route('/')
 def home():
@@ -523,15 +820,15 @@ def start_scraping():
         # Generar ID único para la tarea
         task_id = f"task_{int(time.time())}"
         
-        # Agregar tarea a la cola
-        scraping_queue.put(task_id)
-        
-        # Inicializar resultado
-        scraping_results[task_id] = {
+        # Inicializar resultado antes de encolar para que el worker no lo sobrescriba
+        set_result(task_id, {
             'status': 'processing',
             'message': 'Scraping iniciado',
             'data': None
-        }
+        })
+        
+        # Agregar tarea a la cola del backend configurado
+        dispatch_task(task_id)
         
         logger.info(f"📋 Tarea de scraping {task_id} agregada a la cola")
         
@@ -554,14 +851,14 @@ def start_scraping():
 def get_status(task_id):
     """Obtiene el estado de una tarea de scraping"""
     try:
-        if task_id not in scraping_results:
+        result = get_result(task_id)
+        
+        if result is None:
             return jsonify({
                 'success': False,
                 'error': 'Tarea no encontrada'
             }), 404
         
-        result = scraping_results[task_id]
-        
         return jsonify({
             'success': True,
             'task_id': task_id,
@@ -583,37 +880,30 @@ def get_status(task_id):
 def download_data(task_id):
     """Descarga los datos extraídos en formato JSON"""
     try:
-        if task_id not in scraping_results:
+        result = get_result(task_id)
+        
+        if result is None:
             return jsonify({
                 'success': False,
                 'error': 'Tarea no encontrada'
             }), 404
         
-        result = scraping_results[task_id]
-        
         if result['status'] != 'success' or not result['data']:
             return jsonify({
                 'success': False,
                 'error': 'No hay datos disponibles para descargar'
             }), 400
         
-        # Crear archivo temporal
-        temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8')
-        
         # Preparar datos para exportar
-        meses = {
-            1: "enero", 2: "febrero", 3: "marzo", 4: "abril",
-            5: "mayo", 6: "junio", 7: "julio", 8: "agosto",
-            9: "septiembre", 10: "octubre", 11: "noviembre", 12: "diciembre"
-        }
-        mes_actual = meses[datetime.now().month]
+        now = datetime.now()
+        mes_actual = _MESES[now.month - 1]
         
         output_data = {
             "metadata": {
-                "fecha_extraccion": datetime.now().isoformat(),
+                "fecha_extraccion": now.isoformat(),
                 "total_registros": len(result['data']),
                 "formato_fecha": "YYYY-MM-DD",
-                "año_ejecucion": datetime.now().year,
+                "año_ejecucion": now.year,
                 "fuente": "HermessApp",
                 "descripcion": "Lista de cumpleaños de pacientes extraída automáticamente",
                 "task_id": task_id
@@ -621,16 +911,18 @@ def download_data(task_id):
             "cumpleanos": result['data']
         }
         
-        json.dump(output_data, temp_file, ensure_ascii=False, indent=2)
-        temp_file.close()
+        # Serializar directamente a bytes: sin archivos temporales en disco
+        if orjson:
+            content = orjson.dumps(output_data)
+        else:
+            content = json.dumps(output_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
         
         filename = f"cumpleanos_{mes_actual}_{task_id}.json"
         
-        return send_file(
-            temp_file.name,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/json'
+        return Response(
+            content,
+            mimetype='application/json',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
         
     except Exception as e:
@@ -643,39 +935,34 @@ def download_data(task_id):
 @app.route('/health')
 def health_check():
     """Verifica el estado de la API"""
+    # Copia bajo el lock y conteo fuera de él para no bloquear a los workers
+    with results_lock:
+        results = list(scraping_results.values())
+    active_tasks = len([r for r in results if r['status'] == 'processing'])
+    
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'environment': os.getenv('ENVIRONMENT', 'unknown'),
-        'queue_size': scraping_queue.qsize(),
-        'active_tasks': len([r for r in scraping_results.values() if r['status'] == 'processing'])
+        'queue_size': pending_tasks(),
+        'active_tasks': active_tasks
     })
 
 @app.route('/cleanup', methods=['POST'])
 def cleanup_old_tasks():
     """Limpia tareas antiguas para liberar memoria"""
     try:
-        current_time = time.time()
-        cleaned_count = 0
-        
-        # Eliminar tareas más antiguas que 1 hora
-        tasks_to_remove = []
-        for task_id, result in scraping_results.items():
-            if result.get('timestamp'):
-                task_time = datetime.fromisoformat(result['timestamp']).timestamp()
-                if current_time - task_time > 3600:  # 1 hora
-                    tasks_to_remove.append(task_id)
-        
-        for task_id in tasks_to_remove:
-            del scraping_results[task_id]
-            cleaned_count += 1
+        # Las tareas de más de 1 hora expiran solas; aquí solo se fuerza la purga
+        with results_lock:
+            cleaned_count = len(scraping_results.expire())
+            remaining_tasks = len(scraping_results)
         
         logger.info(f"🧹 Limpieza completada: {cleaned_count} tareas eliminadas")
         
         return jsonify({
             'success': True,
             'cleaned_tasks': cleaned_count,
-            'remaining_tasks': len(scraping_results)
+            'remaining_tasks': remaining_tasks
         })
         
     except Exception as e:
@@ -695,9 +982,20 @@ if __name__ == '__main__':
     
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('DEBUG', 'false').lower() == 'true'
+    threads = int(os.getenv('WEB_THREADS', 16))
     
     logger.info(f"🚀 Iniciando API Scraper en puerto {port}")
     logger.info(f"🌍 Entorno: {os.getenv('ENVIRONMENT')}")
     logger.info(f"👻 Headless: {os.getenv('HEADLESS')}")
     
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    try:
+        from waitress import serve
+    except ImportError:
+        serve = None
+    
+    # Servidor WSGI con varios hilos; el servidor de desarrollo de Flask solo en modo debug
+    if serve and not debug:
+        logger.info(f"🧵 Sirviendo con waitress ({threads} hilos)")
+        serve(app, host='0.0.0.0', port=port, threads=threads)
+    else:
+        app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)